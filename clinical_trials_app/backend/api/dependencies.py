@@ -0,0 +1,23 @@
+"""
+Shared route dependencies
+"""
+from fastapi import HTTPException, Request
+
+from services.clinicaltrials_client import ClinicalTrialsClient
+from services.matcher import TrialMatcher
+
+
+def get_trials_client(request: Request) -> ClinicalTrialsClient:
+    """ClinicalTrials.gov client created at application startup"""
+    return request.app.state.trials_client
+
+
+def get_matcher(request: Request) -> TrialMatcher:
+    """Trial matcher created at application startup"""
+    matcher = request.app.state.matcher
+    if matcher is None:
+        raise HTTPException(
+            status_code=500,
+            detail="Server configuration error. Please ensure ANTHROPIC_API_KEY is set."
+        )
+    return matcher
@@ -1,15 +1,15 @@
 """
 Patient-trial matching endpoints
 """
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import List
 import logging
 import csv
-import json
 from io import StringIO
 from fastapi.responses import StreamingResponse, JSONResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
 
+from api.dependencies import get_matcher, get_trials_client
 from models.patient import PatientData
 from models.trial import MatchResult
 from services.clinicaltrials_client import ClinicalTrialsClient
@@ -18,9 +18,9 @@ from services.matcher import TrialMatcher
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-# Initialize services
-trials_client = ClinicalTrialsClient()
-matcher = TrialMatcher()
+# Serialize straight to JSON bytes via pydantic-core, skipping intermediate dicts
+_MATCH_ADAPTER = TypeAdapter(MatchResult)
+_MATCHES_ADAPTER = TypeAdapter(List[MatchResult])
 
 
 class MatchRequest(BaseModel):
@@ -36,7 +36,9 @@ async def match_patient(
     patient: PatientData,
     condition: str = Query(..., description="Medical condition to search trials for"),
     max_trials: int = Query(10, ge=1, le=50, description="Maximum number of trials to match"),
-    min_score: float = Query(0.0, ge=0.0, le=1.0, description="Minimum match score threshold")
+    min_score: float = Query(0.0, ge=0.0, le=1.0, description="Minimum match score threshold"),
+    trials_client: ClinicalTrialsClient = Depends(get_trials_client),
+    matcher: TrialMatcher = Depends(get_matcher)
 ):
     """
     Match a patient to clinical trials
@@ -78,7 +80,8 @@ async def match_patient(
         matches = await matcher.match_patient_to_trials(
             patient=patient,
             trials=trials,
-            min_score=min_score
+            min_score=min_score,
+            top_k=max_trials
         )
 
         logger.info(f"Matched patient to {len(matches)} trials")
@@ -98,7 +101,9 @@ async def match_patient(
 @router.post("/match/{nct_id}", response_model=MatchResult)
 async def match_patient_to_specific_trial(
     nct_id: str,
-    patient: PatientData
+    patient: PatientData,
+    trials_client: ClinicalTrialsClient = Depends(get_trials_client),
+    matcher: TrialMatcher = Depends(get_matcher)
 ):
     """
     Match a patient to a specific trial by NCT ID
@@ -137,9 +142,16 @@ async def export_matches_csv(matches: List[MatchResult]):
 
     Example request body: [list of MatchResult objects]
     """
-    try:
-        output = StringIO()
-        writer = csv.writer(output)
+    def generate_rows():
+        # Reuse one small buffer and emit each row as soon as it is written
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+
+        def flush() -> str:
+            row = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            return row
 
         # Write header
         writer.writerow([
@@ -152,6 +164,7 @@ async def export_matches_csv(matches: List[MatchResult]):
             "Inclusion Mismatches",
             "Exclusion Violations"
         ])
+        yield flush()
 
         # Write data
         for match in matches:
@@ -165,11 +178,11 @@ async def export_matches_csv(matches: List[MatchResult]):
                 "; ".join(match.inclusion_mismatches),
                 "; ".join(match.exclusion_violations)
             ])
+            yield flush()
 
-        output.seek(0)
-
+    try:
         return StreamingResponse(
-            iter([output.getvalue()]),
+            generate_rows(),
             media_type="text/csv",
             headers={"Content-Disposition": "attachment; filename=trial_matches.csv"}
         )
@@ -180,17 +193,32 @@ async def export_matches_csv(matches: List[MatchResult]):
 
 
 @router.post("/export/json")
-async def export_matches_json(matches: List[MatchResult]):
+async def export_matches_json(
+    matches: List[MatchResult],
+    pretty: bool = Query(False, description="Indent the JSON output")
+):
     """
     Export match results to JSON format
 
     Example request body: [list of MatchResult objects]
     """
+    def generate_compact():
+        # Emit the array one element at a time
+        yield b"["
+        for i, match in enumerate(matches):
+            if i:
+                yield b","
+            yield _MATCH_ADAPTER.dump_json(match)
+        yield b"]"
+
     try:
-        data = [match.model_dump() for match in matches]
+        if pretty:
+            content = iter([_MATCHES_ADAPTER.dump_json(matches, indent=2)])
+        else:
+            content = generate_compact()
 
         return StreamingResponse(
-            iter([json.dumps(data, indent=2, default=str)]),
+            content,
             media_type="application/json",
             headers={"Content-Disposition": "attachment; filename=trial_matches.json"}
         )
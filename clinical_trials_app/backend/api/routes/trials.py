@@ -1,26 +1,25 @@
 """
 Clinical trials search endpoints
 """
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import List, Optional
 import logging
 
+from api.dependencies import get_trials_client
 from models.trial import ClinicalTrial
 from services.clinicaltrials_client import ClinicalTrialsClient
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-# Initialize client
-trials_client = ClinicalTrialsClient()
-
 
 @router.get("/search", response_model=List[ClinicalTrial])
 async def search_trials(
     condition: Optional[str] = Query(None, description="Medical condition to search for"),
     keywords: Optional[str] = Query(None, description="Additional search keywords"),
     max_results: int = Query(20, ge=1, le=100, description="Maximum number of results"),
-    recruiting_only: bool = Query(True, description="Only show recruiting trials")
+    recruiting_only: bool = Query(True, description="Only show recruiting trials"),
+    trials_client: ClinicalTrialsClient = Depends(get_trials_client)
 ):
     """
     Search for clinical trials
@@ -49,7 +48,10 @@ async def search_trials(
 
 
 @router.get("/{nct_id}", response_model=ClinicalTrial)
-async def get_trial(nct_id: str):
+async def get_trial(
+    nct_id: str,
+    trials_client: ClinicalTrialsClient = Depends(get_trials_client)
+):
     """
     Get a specific trial by NCT ID
 
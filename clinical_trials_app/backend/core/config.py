@@ -18,6 +18,27 @@ class Settings(BaseSettings):
     # Anthropic Settings (optional, for cloud API)
     ANTHROPIC_API_KEY: str = ""
 
+    # LLM Concurrency
+    # Maximum number of in-flight LLM requests across the whole process. The
+    # limit is shared by all concurrent API requests (one TrialMatcher serves
+    # the app), not applied per match. With Ollama, requests beyond the
+    # server's OLLAMA_NUM_PARALLEL (parallel requests per loaded model) are
+    # queued server-side, so set OLLAMA_NUM_PARALLEL to at least this value
+    # (summed over all app processes sharing the server);
+    # OLLAMA_MAX_LOADED_MODELS caps how many models stay resident.
+    LLM_MAX_CONCURRENCY: int = 4
+    # Trials evaluated per LLM prompt. Larger batches send the patient profile
+    # once for several trials (fewer calls, fewer prompt tokens) at the cost of
+    # longer individual responses. Set to 1 to match one trial per call.
+    LLM_BATCH_SIZE: int = 4
+    # Per-attempt timeout (seconds) for each trial in an LLM request, so a
+    # batched prompt gets LLM_TIMEOUT * its trial count; and total attempts
+    # for each LLM request
+    LLM_TIMEOUT: float = 120.0
+    LLM_MAX_ATTEMPTS: int = 3
+    # Eligibility criteria are trimmed to this many characters before prompting
+    MAX_CRITERIA_CHARS: int = 4000
+
     # Application
     ENVIRONMENT: str = "development"
     DEBUG: bool = True
@@ -27,10 +48,16 @@ class Settings(BaseSettings):
 
     # ClinicalTrials.gov API
     CLINICALTRIALS_API_URL: str = "https://clinicaltrials.gov/api/v2"
+    # Maximum simultaneous requests to ClinicalTrials.gov, and total attempts
+    # per request when it fails transiently (timeout, 429 or 5xx)
+    MAX_CONCURRENT_TRIAL_REQUESTS: int = 8
+    CLINICALTRIALS_MAX_ATTEMPTS: int = 3
 
     # Cache
     ENABLE_CACHE: bool = True
     CACHE_EXPIRY_HOURS: int = 24
+    # Oldest cached queries are evicted on write once this many are stored
+    MAX_CACHE_ENTRIES: int = 5000
 
     class Config:
         env_file = ".env"
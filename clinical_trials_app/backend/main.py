@@ -12,6 +12,8 @@ import os
 
 from api.routes import trials, matching
 from core.config import settings
+from services.clinicaltrials_client import ClinicalTrialsClient
+from services.matcher import TrialMatcher
 
 # Configure logging
 logging.basicConfig(
@@ -28,8 +30,22 @@ load_dotenv()
 async def lifespan(app: FastAPI):
     """Application lifespan manager"""
     logger.info("Starting Clinical Trial Matching API")
+
+    # Shared service instances, injected into routes via api.dependencies
+    app.state.trials_client = ClinicalTrialsClient()
+    try:
+        app.state.matcher = TrialMatcher()
+    except ValueError as e:
+        # Keep serving trial search; matching endpoints report the error
+        logger.error(f"Configuration error: {e}")
+        app.state.matcher = None
+
     yield
+
     logger.info("Shutting down Clinical Trial Matching API")
+    await app.state.trials_client.aclose()
+    if app.state.matcher is not None:
+        await app.state.matcher.aclose()
 
 
 # Initialize FastAPI app
@@ -1,7 +1,7 @@
 """
 Patient data models for EMR representation
 """
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional
 from datetime import date
 from enum import Enum
@@ -71,8 +71,10 @@ class PatientData(BaseModel):
         description="Pregnancy status (for females)"
     )
 
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        frozen=True,
+        extra="ignore",
+        json_schema_extra={
             "example": {
                 "age": 55,
                 "gender": "male",
@@ -107,3 +109,4 @@ class PatientData(BaseModel):
                 "smoking_status": "former"
             }
         }
+    )
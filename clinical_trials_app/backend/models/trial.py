@@ -1,7 +1,7 @@
 """
 Clinical trial data models
 """
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional
 from datetime import datetime
 
@@ -33,8 +33,10 @@ class ClinicalTrial(BaseModel):
     # Interventions
     interventions: List[str] = Field(default_factory=list, description="Interventions/treatments")
 
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        frozen=True,
+        extra="ignore",
+        json_schema_extra={
             "example": {
                 "nct_id": "NCT12345678",
                 "title": "A Study of Drug X in Patients with Type 2 Diabetes",
@@ -51,6 +53,7 @@ class ClinicalTrial(BaseModel):
                 "interventions": ["Drug X", "Placebo"]
             }
         }
+    )
 
 
 class MatchResult(BaseModel):
@@ -82,8 +85,12 @@ class MatchResult(BaseModel):
     explanation: str = Field(..., description="Human-readable explanation of the match")
     reasoning: Optional[str] = Field(None, description="Detailed AI reasoning")
 
-    class Config:
-        json_schema_extra = {
+    model_config = ConfigDict(
+        frozen=True,
+        extra="ignore",
+        # Already-validated ClinicalTrial instances are reused as-is
+        revalidate_instances="never",
+        json_schema_extra={
             "example": {
                 "trial": {
                     "nct_id": "NCT12345678",
@@ -106,3 +113,4 @@ class MatchResult(BaseModel):
                 "reasoning": "The patient meets age requirements, has the target condition with appropriate lab values, and has no disqualifying conditions."
             }
         }
+    )
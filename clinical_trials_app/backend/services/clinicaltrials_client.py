@@ -3,87 +3,424 @@ Client for ClinicalTrials.gov API v2
 Documentation: https://clinicaltrials.gov/data-api/api
 """
 
+import asyncio
+import functools
 import httpx
 import logging
-from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
-import json
+from typing import Awaitable, Callable, List, Literal, NamedTuple, Optional, Dict, Any, Tuple
+import msgspec
 import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+import zstandard as zstd
 
 from models.trial import ClinicalTrial
 from core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# In-process memo of parsed results, in front of the disk cache
+_MEM_CACHE_TTL_SECONDS = 60.0
+_MEM_CACHE_MAX_ENTRIES = 256
+
+def _is_retryable(e: BaseException) -> bool:
+    """Whether a ClinicalTrials.gov request failed transiently (network error, 429 or 5xx)"""
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code == 429 or e.response.status_code >= 500
+    return isinstance(e, httpx.TransportError)
+
+
+_retry_transient = retry(
+    retry=retry_if_exception(_is_retryable),
+    wait=wait_exponential(multiplier=0.5, max=8),
+    stop=stop_after_attempt(settings.CLINICALTRIALS_MAX_ATTEMPTS),
+    reraise=True
+)
+
+
+# Typed views of the API v2 study JSON, covering only the fields we read.
+# Decoding straight into these skips building intermediate dicts for the
+# rest of the (large) study document; unknown fields are ignored. Fields
+# that may come back as null are Optional, keeping the defaults used when
+# they are absent.
+
+class _IdentificationModule(msgspec.Struct, frozen=True, rename="camel"):
+    nct_id: str = ""
+    brief_title: str = ""
+
+
+class _DescriptionModule(msgspec.Struct, frozen=True, rename="camel"):
+    brief_summary: Optional[str] = ""
+
+
+class _EligibilityModule(msgspec.Struct, frozen=True, rename="camel"):
+    eligibility_criteria: str = ""
+    minimum_age: Optional[str] = None
+    maximum_age: Optional[str] = None
+    sex: Optional[str] = "ALL"
+
+
+class _StatusModule(msgspec.Struct, frozen=True, rename="camel"):
+    overall_status: Optional[str] = ""
+
+
+class _EnrollmentInfo(msgspec.Struct, frozen=True):
+    count: Optional[int] = None
+
+
+class _DesignModule(msgspec.Struct, frozen=True, rename="camel"):
+    phases: Optional[Tuple[str, ...]] = None
+    enrollment_info: _EnrollmentInfo = _EnrollmentInfo()
+
+
+class _ConditionsModule(msgspec.Struct, frozen=True):
+    conditions: Optional[Tuple[str, ...]] = None
+
+
+class _Intervention(msgspec.Struct, frozen=True):
+    name: str = ""
+
+
+class _ArmsInterventionsModule(msgspec.Struct, frozen=True):
+    interventions: Optional[Tuple[_Intervention, ...]] = None
+
+
+class _Location(msgspec.Struct, frozen=True):
+    city: Optional[str] = None
+    state: Optional[str] = None
+
+
+class _ContactsLocationsModule(msgspec.Struct, frozen=True):
+    locations: Optional[Tuple[_Location, ...]] = None
+
+
+class _ProtocolSection(msgspec.Struct, frozen=True, rename="camel"):
+    identification_module: _IdentificationModule = _IdentificationModule()
+    description_module: _DescriptionModule = _DescriptionModule()
+    eligibility_module: _EligibilityModule = _EligibilityModule()
+    status_module: _StatusModule = _StatusModule()
+    design_module: _DesignModule = _DesignModule()
+    conditions_module: _ConditionsModule = _ConditionsModule()
+    arms_interventions_module: _ArmsInterventionsModule = _ArmsInterventionsModule()
+    contacts_locations_module: _ContactsLocationsModule = _ContactsLocationsModule()
+
+
+class _Study(msgspec.Struct, frozen=True, rename="camel"):
+    protocol_section: Optional[_ProtocolSection] = None
+
+
+class _StudyEnvelope(msgspec.Struct, frozen=True):
+    # Left raw so each study is decoded on its own and one malformed study
+    # doesn't fail the whole page
+    studies: Tuple[msgspec.Raw, ...] = ()
+
+
+_NO_PROTOCOL = _ProtocolSection()
+_ENVELOPE_DECODER = msgspec.json.Decoder(_StudyEnvelope)
+# strict=False allows lax coercions such as 100.0 -> 100 for counts
+_STUDY_DECODER = msgspec.json.Decoder(_Study, strict=False)
+
+
+class _CacheEntry(NamedTuple):
+    """A cached result with the validators needed to revalidate it upstream"""
+    data: Any
+    stale: bool
+    etag: Optional[str]
+    last_modified: Optional[str]
+
 
 class ClinicalTrialsClient:
     """Client for interacting with ClinicalTrials.gov API"""
 
+    HEADERS = {
+        "User-Agent": "ClinicalTrialsMatchingApp/1.0 (Educational/Research Purpose)",
+        # Study JSON compresses ~10x; br decoding needs the brotli extra
+        "Accept-Encoding": "gzip, br"
+    }
+
     def __init__(self):
         self.base_url = settings.CLINICALTRIALS_API_URL
         self.cache_dir = Path("trials_cache")
         self.cache_enabled = settings.ENABLE_CACHE
         self.cache_expiry_hours = settings.CACHE_EXPIRY_HOURS
-
+        # Precomputed so expiry checks are a single float comparison
+        self._cache_ttl_seconds = self.cache_expiry_hours * 3600.0
+
+        # Cached results live in one SQLite table keyed by query. WAL mode lets
+        # readers proceed while a write commits; the connection is shared by
+        # worker threads, serialized through _db_lock.
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._max_entries = settings.MAX_CACHE_ENTRIES
+        self._entry_count = 0
         if self.cache_enabled:
             self.cache_dir.mkdir(exist_ok=True)
+            self._db = sqlite3.connect(self.cache_dir / "trials.db", check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS cache (k TEXT PRIMARY KEY, ts REAL, blob BLOB)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS cache_ts ON cache (ts)")
+            # Response validators for conditional GETs; added after the table
+            # first shipped, so older databases are migrated in place
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(cache)")}
+            for column in ("etag", "last_modified"):
+                if column not in columns:
+                    self._db.execute(f"ALTER TABLE cache ADD COLUMN {column} TEXT")
+            # Tracked on write so the size cap doesn't need a COUNT(*) each time
+            self._entry_count = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+        # Cache entries are zstd-compressed; level 3 keeps compression cheap
+        # while still shrinking the repetitive study text several-fold
+        self._zctx_c = zstd.ZstdCompressor(level=3)
+        self._zctx_d = zstd.ZstdDecompressor()
+
+        # query_key -> (expires_at, parsed result), in LRU order. Only touched
+        # from synchronous code on the event loop, so no lock is needed.
+        self._mem_cache: OrderedDict = OrderedDict()
+
+        # query_key -> task running the upstream fetch for it
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+        # query_key -> background task refreshing a stale cache entry; also
+        # keeps a reference so the task isn't garbage collected mid-run
+        self._refreshing: Dict[str, asyncio.Task] = {}
+
+        # Shared HTTP client, created on first use and closed via aclose()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_lock = asyncio.Lock()
+
+        # Bounds simultaneous upstream requests so bursts queue here instead
+        # of opening a connection per caller and tripping rate limits
+        self._sem = asyncio.Semaphore(settings.MAX_CONCURRENT_TRIAL_REQUESTS)
+
+    async def _get_client(self) -> httpx.AsyncClient:
+        """Get the pooled HTTP client, creating it if needed"""
+        if self._client is None:
+            async with self._client_lock:
+                if self._client is None:
+                    self._client = httpx.AsyncClient(
+                        base_url=self.base_url,
+                        headers=self.HEADERS,
+                        timeout=30.0,
+                        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+                        http2=True
+                    )
+        return self._client
+
+    async def aclose(self):
+        """Cancel background refreshes and in-flight fetches, close the pooled HTTP client and the cache database"""
+        tasks = [*self._refreshing.values(), *self._inflight.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+        await asyncio.to_thread(self._sync_close)
+
+    def _sync_close(self):
+        """Close the cache database; runs in a worker thread"""
+        # Worker threads from just-cancelled saves may still be writing;
+        # wait for them via the lock rather than closing underneath them
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _mem_get(self, query_key: str) -> Optional[Any]:
+        """Get a parsed result from the in-process memo if it has not expired"""
+        entry = self._mem_cache.get(query_key)
+        if entry is None:
+            return None
 
-    def _get_cache_path(self, query_key: str) -> Path:
-        """Get cache file path for a query"""
-        return self.cache_dir / f"{query_key}.json"
-
-    def _is_cache_valid(self, cache_path: Path) -> bool:
-        """Check if cache file is still valid"""
-        if not cache_path.exists():
-            return False
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            del self._mem_cache[query_key]
+            return None
 
-        try:
-            with open(cache_path, 'r') as f:
-                cache_data = json.load(f)
-                cached_time = datetime.fromisoformat(cache_data.get('timestamp', ''))
-                expiry_time = cached_time + timedelta(hours=self.cache_expiry_hours)
-                return datetime.now() < expiry_time
-        except Exception as e:
-            logger.warning(f"Error reading cache: {e}")
-            return False
+        self._mem_cache.move_to_end(query_key)
+        return value
 
-    def _save_to_cache(self, query_key: str, data: Any):
-        """Save data to cache"""
+    def _mem_put(self, query_key: str, value: Any):
+        """Store a parsed result in the in-process memo, evicting the least recently used"""
         if not self.cache_enabled:
             return
 
-        cache_path = self._get_cache_path(query_key)
-        cache_data = {
-            'timestamp': datetime.now().isoformat(),
-            'data': data
-        }
+        self._mem_cache[query_key] = (time.monotonic() + _MEM_CACHE_TTL_SECONDS, value)
+        self._mem_cache.move_to_end(query_key)
+        while len(self._mem_cache) > _MEM_CACHE_MAX_ENTRIES:
+            self._mem_cache.popitem(last=False)
+
+    async def _coalesce(self, query_key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fetch once per query key; concurrent callers share the same result"""
+        task = self._inflight.get(query_key)
+        if task is None:
+            # The fetch runs as its own task rather than inside the first
+            # caller's, so it belongs to no single caller
+            task = asyncio.ensure_future(fetch())
+            self._inflight[query_key] = task
+            task.add_done_callback(functools.partial(self._inflight_done, query_key))
+
+        # Shield so a cancelled caller stops waiting without cancelling the
+        # fetch for everyone else
+        return await asyncio.shield(task)
+
+    def _inflight_done(self, query_key: str, task: asyncio.Task):
+        """Drop a finished fetch from the in-flight registry"""
+        if self._inflight.get(query_key) is task:
+            del self._inflight[query_key]
+        # Mark the exception retrieved in case every waiter was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def _sync_load(self, query_key: str) -> Optional[Tuple[float, Any, Optional[str], Optional[str]]]:
+        """Read and decode a cache row as (ts, data, etag, last_modified); runs in a worker thread"""
+        with self._db_lock:
+            # aclose() may have closed the database while this worker was queued
+            if self._db is None:
+                return None
+
+            row = self._db.execute(
+                "SELECT ts, blob, etag, last_modified FROM cache WHERE k = ?", (query_key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            # zstd contexts aren't safe for concurrent use, so decompress
+            # under the lock too
+            ts, blob, etag, last_modified = row
+            blob = self._zctx_d.decompress(blob)
+
+        # Only ever read back rows this client wrote itself
+        return ts, pickle.loads(blob), etag, last_modified
+
+    def _sync_save(self, query_key: str, data: Any, etag: Optional[str], last_modified: Optional[str]):
+        """Encode and write a cache row, evicting the oldest rows past the size cap; runs in a worker thread"""
+        blob = pickle.dumps(data, protocol=5)
+        ts = time.time()
+
+        with self._db_lock:
+            if self._db is None:
+                return
+
+            with self._db:
+                blob = self._zctx_c.compress(blob)
+                is_new = self._db.execute(
+                    "SELECT 1 FROM cache WHERE k = ?", (query_key,)
+                ).fetchone() is None
+                self._db.execute(
+                    "INSERT OR REPLACE INTO cache (k, ts, blob, etag, last_modified) VALUES (?, ?, ?, ?, ?)",
+                    (query_key, ts, blob, etag, last_modified)
+                )
+                if is_new:
+                    self._entry_count += 1
+
+                # Pruning only happens on writes, so reads stay a single lookup
+                if self._entry_count > self._max_entries:
+                    self._evict(self._entry_count - self._max_entries)
+
+    def _sync_touch(self, query_key: str):
+        """Restart a cache row's TTL without rewriting it; runs in a worker thread"""
+        with self._db_lock:
+            if self._db is None:
+                return
+
+            with self._db:
+                self._db.execute("UPDATE cache SET ts = ? WHERE k = ?", (time.time(), query_key))
+
+    def _evict(self, n: int):
+        """Delete the n oldest cache rows; caller holds _db_lock"""
+        # Trim an extra 10% so the next writes don't each trigger a prune
+        n += self._max_entries // 10
+        deleted = self._db.execute(
+            "DELETE FROM cache WHERE k IN (SELECT k FROM cache ORDER BY ts LIMIT ?)", (n,)
+        ).rowcount
+        self._entry_count -= deleted
+        logger.info(f"Evicted {deleted} cache entries")
+
+    def _cache_state(self, ts: Optional[float]) -> Literal["fresh", "stale", "missing"]:
+        """Classify a cache entry by the time it was written"""
+        if ts is None:
+            return "missing"
+        return "fresh" if time.time() - ts < self._cache_ttl_seconds else "stale"
+
+    async def _save_to_cache(
+        self,
+        query_key: str,
+        data: Any,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None
+    ):
+        """Save parsed trials to cache, pickled as-is so loading skips re-validation"""
+        if not self.cache_enabled:
+            return
 
         try:
-            with open(cache_path, 'w') as f:
-                json.dump(cache_data, f, indent=2)
+            await asyncio.to_thread(self._sync_save, query_key, data, etag, last_modified)
             logger.info(f"Saved to cache: {query_key}")
         except Exception as e:
             logger.warning(f"Error saving to cache: {e}")
 
-    def _load_from_cache(self, query_key: str) -> Optional[Any]:
+    async def _touch_cache(self, query_key: str):
+        """Mark a cache entry as fresh again after upstream confirmed it is unchanged"""
+        if not self.cache_enabled:
+            return
+
+        try:
+            await asyncio.to_thread(self._sync_touch, query_key)
+            logger.info(f"Revalidated cache: {query_key}")
+        except Exception as e:
+            logger.warning(f"Error revalidating cache: {e}")
+
+    async def _load_from_cache(self, query_key: str) -> Optional[_CacheEntry]:
         """Load data from cache"""
         if not self.cache_enabled:
             return None
 
-        cache_path = self._get_cache_path(query_key)
+        try:
+            row = await asyncio.to_thread(self._sync_load, query_key)
+            state = self._cache_state(row[0] if row else None)
 
-        if self._is_cache_valid(cache_path):
-            try:
-                with open(cache_path, 'r') as f:
-                    cache_data = json.load(f)
-                    logger.info(f"Loaded from cache: {query_key}")
-                    return cache_data.get('data')
-            except Exception as e:
-                logger.warning(f"Error loading from cache: {e}")
+            if state != "missing":
+                logger.info(f"Loaded from cache ({state}): {query_key}")
+                return _CacheEntry(row[1], state == "stale", row[2], row[3])
+        except Exception as e:
+            logger.warning(f"Error loading from cache: {e}")
 
         return None
 
+    def _conditional_headers(self, cached: Optional[_CacheEntry]) -> Dict[str, str]:
+        """Build If-None-Match/If-Modified-Since headers from a cached entry's validators"""
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+        return headers
+
+    def _refresh_in_background(self, query_key: str, fetch: Callable[[], Awaitable[Any]]):
+        """Start refreshing a stale cache entry unless a refresh is already running"""
+        if query_key in self._refreshing:
+            return
+        self._refreshing[query_key] = asyncio.create_task(self._refresh(query_key, fetch))
+
+    async def _refresh(self, query_key: str, fetch: Callable[[], Awaitable[Any]]):
+        """Re-fetch a stale cache entry; failures leave the stale entry in place"""
+        try:
+            await self._coalesce(query_key, fetch)
+        except Exception as e:
+            logger.warning(f"Background refresh failed for {query_key}: {e}")
+        finally:
+            del self._refreshing[query_key]
+
     async def search_trials(
         self,
         condition: Optional[str] = None,
@@ -107,121 +444,131 @@ class ClinicalTrialsClient:
         cache_key = f"{condition or 'none'}_{keywords or 'none'}_{max_results}_{recruiting_only}"
 
         # Check cache
-        cached_data = self._load_from_cache(cache_key)
-        if cached_data:
-            return [ClinicalTrial(**trial) for trial in cached_data]
+        memo = self._mem_get(cache_key)
+        if memo is not None:
+            return memo
 
-        # Build query parameters
-        query_parts = []
+        # Build API request
+        params: Dict[str, Any] = {"format": "json", "pageSize": max_results}
         if condition:
-            query_parts.append(f"AREA[ConditionSearch]{condition}")
+            params["query.cond"] = condition
         if keywords:
-            query_parts.append(f"AREA[Search]{keywords}")
+            params["query.term"] = keywords
         if recruiting_only:
-            query_parts.append("AREA[RecruitmentStatus]RECRUITING")
-
-        query = " AND ".join(query_parts) if query_parts else None
-
-        # Build API request
-        params = {
-            "format": "json",
-            "pageSize": max_results,
-        }
+            params["filter.overallStatus"] = "RECRUITING"
+
+        # Serve an expired cache entry immediately and refresh it behind the scenes
+        cached = await self._load_from_cache(cache_key)
+        if cached and cached.data:
+            if cached.stale:
+                self._refresh_in_background(
+                    cache_key, functools.partial(self._fetch_trials, cache_key, params, cached)
+                )
+            else:
+                self._mem_put(cache_key, cached.data)
+            return cached.data
+
+        return await self._coalesce(cache_key, functools.partial(self._fetch_trials, cache_key, params))
+
+    async def _fetch_trials(
+        self,
+        cache_key: str,
+        params: Dict[str, Any],
+        cached: Optional[_CacheEntry] = None
+    ) -> List[ClinicalTrial]:
+        """Fetch and parse a page of studies, then cache it; a given cached entry is revalidated"""
+        try:
+            # Updated API v2 endpoint
+            logger.info(f"Fetching trials from ClinicalTrials.gov: {self.base_url}/studies")
 
-        if query:
-            params["query.cond"] = condition if condition else None
-            params["query.term"] = keywords if keywords else None
-            params["filter.overallStatus"] = "RECRUITING" if recruiting_only else None
+            trials, headers = await self._request_studies(params, self._conditional_headers(cached))
 
-        # Clean None values
-        params = {k: v for k, v in params.items() if v is not None}
+            if trials is None:
+                # 304 Not Modified: keep the cached page and restart its TTL
+                trials = cached.data
+                await self._touch_cache(cache_key)
+            else:
+                await self._save_to_cache(
+                    cache_key, trials, headers.get("etag"), headers.get("last-modified")
+                )
+            self._mem_put(cache_key, trials)
 
-        try:
-            headers = {
-                "User-Agent": "ClinicalTrialsMatchingApp/1.0 (Educational/Research Purpose)"
-            }
-            async with httpx.AsyncClient(timeout=30.0, headers=headers) as client:
-                # Updated API v2 endpoint
-                url = f"{self.base_url}/studies"
-                logger.info(f"Fetching trials from ClinicalTrials.gov: {url}")
-
-                response = await client.get(url, params=params)
-                response.raise_for_status()
-
-                data = response.json()
-                studies = data.get("studies", [])
-
-                trials = []
-                for study in studies:
-                    try:
-                        trial = self._parse_study(study)
-                        trials.append(trial)
-                    except Exception as e:
-                        logger.warning(f"Error parsing study: {e}")
-                        continue
-
-                # Save to cache
-                self._save_to_cache(cache_key, [trial.model_dump() for trial in trials])
-
-                logger.info(f"Found {len(trials)} trials")
-                return trials
+            logger.info(f"Found {len(trials)} trials")
+            return trials
 
         except Exception as e:
             logger.error(f"Error searching trials: {e}")
             raise
 
-    def _parse_study(self, study: Dict[str, Any]) -> ClinicalTrial:
-        """Parse study data from API response"""
-        protocol = study.get("protocolSection", {})
-        identification = protocol.get("identificationModule", {})
-        description = protocol.get("descriptionModule", {})
-        eligibility = protocol.get("eligibilityModule", {})
-        status = protocol.get("statusModule", {})
-        design = protocol.get("designModule", {})
-        conditions_module = protocol.get("conditionsModule", {})
-        interventions_module = protocol.get("armsInterventionsModule", {})
-        contacts_locations = protocol.get("contactsLocationsModule", {})
-
-        # Extract eligibility criteria
-        eligibility_criteria = eligibility.get("eligibilityCriteria", "")
-
-        # Extract age limits
-        min_age = eligibility.get("minimumAge", None)
-        max_age = eligibility.get("maximumAge", None)
-
-        # Extract gender
-        gender = eligibility.get("sex", "ALL")
+    @_retry_transient
+    async def _request_studies(
+        self,
+        params: Dict[str, Any],
+        headers: Dict[str, str]
+    ) -> Tuple[Optional[List[ClinicalTrial]], httpx.Headers]:
+        """Fetch and parse a page of studies, retrying transient failures; None on 304"""
+        client = await self._get_client()
+
+        async with self._sem:
+            response = await client.get("/studies", params=params, headers=headers)
+        logger.debug(f"GET /studies: {response.http_version}, {response.headers.get('content-encoding', 'identity')}")
+        if response.status_code == 304:
+            return None, response.headers
+        response.raise_for_status()
+
+        # Decoding and model construction are CPU-bound and hold the GIL, so
+        # per-study thread dispatch would not run in parallel; handle the
+        # whole page in a single worker thread to keep the event loop
+        # responsive instead
+        trials = await asyncio.to_thread(self._parse_studies, response.content)
+        return trials, response.headers
+
+    def _parse_studies(self, content: bytes) -> List[ClinicalTrial]:
+        """Decode and parse a page of studies, skipping any that fail"""
+        trials = []
+        for raw in _ENVELOPE_DECODER.decode(content).studies:
+            try:
+                trial = self._parse_study(_STUDY_DECODER.decode(raw))
+                trials.append(trial)
+            except Exception as e:
+                logger.warning(f"Error parsing study: {e}")
+                continue
+        return trials
+
+    def _parse_study(self, study: _Study) -> ClinicalTrial:
+        """Parse a decoded study into a ClinicalTrial"""
+        protocol = study.protocol_section or _NO_PROTOCOL
+        identification = protocol.identification_module
+        eligibility = protocol.eligibility_module
+        design = protocol.design_module
+        phases = design.phases
 
         # Extract locations
         locations = []
-        for location in contacts_locations.get("locations", []):
-            city = location.get("city", "")
-            state = location.get("state", "")
-            if city and state:
-                locations.append(f"{city}, {state}")
-
-        # Extract conditions
-        conditions = conditions_module.get("conditions", [])
-
-        # Extract interventions
-        interventions = []
-        for intervention in interventions_module.get("interventions", []):
-            interventions.append(intervention.get("name", ""))
-
-        return ClinicalTrial(
-            nct_id=identification.get("nctId", ""),
-            title=identification.get("briefTitle", ""),
-            brief_summary=description.get("briefSummary", ""),
-            eligibility_criteria=eligibility_criteria,
-            minimum_age=min_age,
-            maximum_age=max_age,
-            gender=gender,
-            phase=design.get("phases", ["N/A"])[0] if design.get("phases") else None,
-            enrollment=design.get("enrollmentInfo", {}).get("count", None),
-            status=status.get("overallStatus", ""),
-            locations=locations[:5],  # Limit to 5 locations
-            conditions=conditions,
-            interventions=interventions
+        for location in protocol.contacts_locations_module.locations or ():
+            if location.city and location.state:
+                locations.append(f"{location.city}, {location.state}")
+                if len(locations) == 5:  # Limit to 5 locations
+                    break
+
+        # Field types were already checked by the decoder, so skip re-validation
+        return ClinicalTrial.model_construct(
+            nct_id=identification.nct_id,
+            title=identification.brief_title,
+            brief_summary=protocol.description_module.brief_summary,
+            eligibility_criteria=eligibility.eligibility_criteria,
+            minimum_age=eligibility.minimum_age,
+            maximum_age=eligibility.maximum_age,
+            gender=eligibility.sex,
+            phase=phases[0] if phases else None,
+            enrollment=design.enrollment_info.count,
+            status=protocol.status_module.overall_status,
+            locations=locations,
+            conditions=list(protocol.conditions_module.conditions or ()),
+            interventions=[
+                intervention.name
+                for intervention in protocol.arms_interventions_module.interventions or ()
+            ]
         )
 
     async def get_trial_by_nct(self, nct_id: str) -> Optional[ClinicalTrial]:
@@ -237,33 +584,53 @@ class ClinicalTrialsClient:
         cache_key = f"nct_{nct_id}"
 
         # Check cache
-        cached_data = self._load_from_cache(cache_key)
-        if cached_data:
-            return ClinicalTrial(**cached_data)
-
+        memo = self._mem_get(cache_key)
+        if memo is not None:
+            return memo
+
+        cached = await self._load_from_cache(cache_key)
+        if cached and cached.data:
+            if cached.stale:
+                self._refresh_in_background(
+                    cache_key, functools.partial(self._fetch_trial, cache_key, nct_id, cached)
+                )
+            else:
+                self._mem_put(cache_key, cached.data)
+            return cached.data
+
+        return await self._coalesce(cache_key, functools.partial(self._fetch_trial, cache_key, nct_id))
+
+    async def _fetch_trial(
+        self,
+        cache_key: str,
+        nct_id: str,
+        cached: Optional[_CacheEntry] = None
+    ) -> Optional[ClinicalTrial]:
+        """Fetch and parse a single study, then cache it; a given cached entry is revalidated"""
         try:
-            headers = {
-                "User-Agent": "ClinicalTrialsMatchingApp/1.0 (Educational/Research Purpose)"
-            }
-            async with httpx.AsyncClient(timeout=30.0, headers=headers) as client:
-                url = f"{self.base_url}/studies/{nct_id}"
-                logger.info(f"Fetching trial {nct_id}")
+            logger.info(f"Fetching trial {nct_id}")
 
-                response = await client.get(url, params={"format": "json"})
-                response.raise_for_status()
+            study, headers = await self._request_study(nct_id, self._conditional_headers(cached))
 
-                data = response.json()
-                studies = data.get("studies", [])
+            if study is None:
+                # 304 Not Modified: keep the cached trial and restart its TTL
+                trial = cached.data
+                await self._touch_cache(cache_key)
+                self._mem_put(cache_key, trial)
+                return trial
 
-                if not studies:
-                    return None
+            if study.protocol_section is None:
+                return None
 
-                trial = self._parse_study(studies[0])
+            trial = self._parse_study(study)
 
-                # Save to cache
-                self._save_to_cache(cache_key, trial.model_dump())
+            # Save to cache
+            await self._save_to_cache(
+                cache_key, trial, headers.get("etag"), headers.get("last-modified")
+            )
+            self._mem_put(cache_key, trial)
 
-                return trial
+            return trial
 
         except httpx.HTTPStatusError as e:
             if e.response.status_code == 404:
@@ -274,3 +641,22 @@ class ClinicalTrialsClient:
         except Exception as e:
             logger.error(f"Error fetching trial: {e}")
             raise
+
+    @_retry_transient
+    async def _request_study(
+        self,
+        nct_id: str,
+        headers: Dict[str, str]
+    ) -> Tuple[Optional[_Study], httpx.Headers]:
+        """Fetch a single raw study, retrying transient failures; None on 304"""
+        client = await self._get_client()
+
+        async with self._sem:
+            response = await client.get(f"/studies/{nct_id}", params={"format": "json"}, headers=headers)
+        logger.debug(f"GET /studies/{nct_id}: {response.http_version}, {response.headers.get('content-encoding', 'identity')}")
+        if response.status_code == 304:
+            return None, response.headers
+        response.raise_for_status()
+
+        # Single-study endpoint returns the study object itself
+        return _STUDY_DECODER.decode(response.content), response.headers
@@ -2,10 +2,18 @@
 Clinical trial matching service using local or cloud LLMs
 Supports both Ollama (local, free) and Anthropic Claude (cloud, paid)
 """
+import asyncio
+import functools
+import hashlib
+import heapq
 import logging
-from typing import List, Dict, Any
-import json
+import math
+import re
+from typing import List, Dict, Any, Optional
+import orjson
 import httpx
+from cachetools import TTLCache
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
 
 from models.patient import PatientData
 from models.trial import ClinicalTrial, MatchResult
@@ -13,6 +21,228 @@ from core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Outermost {...} span of an LLM response (skips code fences and prose)
+_JSON_RE = re.compile(rb"\{.*\}", re.DOTALL)
+
+# Byte values compared against while scanning
+_OPEN_BRACE, _CLOSE_BRACE, _QUOTE, _BACKSLASH = b"{}\"\\"
+
+
+def _balanced_object(buf: bytes) -> Optional[bytes]:
+    """Return the first brace-balanced {...} span in buf, ignoring braces inside strings"""
+    start = buf.find(b"{")
+    if start == -1:
+        return None
+
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(buf)):
+        c = buf[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif c == _BACKSLASH:
+                escaped = True
+            elif c == _QUOTE:
+                in_string = False
+        elif c == _QUOTE:
+            in_string = True
+        elif c == _OPEN_BRACE:
+            depth += 1
+        elif c == _CLOSE_BRACE:
+            depth -= 1
+            if depth == 0:
+                return buf[start:i + 1]
+
+    return None
+
+
+# Scoring rubric shared by the single-trial and batched prompts
+_SCORING_GUIDANCE = """Scoring guidance:
+- 1.0 = Perfect match, all inclusion met, no exclusions violated
+- 0.8-0.9 = Strong match, minor uncertainties
+- 0.6-0.7 = Moderate match, some criteria unclear
+- 0.4-0.5 = Weak match, significant mismatches
+- 0.0-0.3 = Poor match or exclusion violated
+
+If eligibility criteria are missing or unclear, make reasonable assumptions based on the trial title and condition.
+IMPORTANT: Return ONLY the JSON object, no other text."""
+
+_PROMPT_TEMPLATE = """You are a clinical trial matching expert. Analyze whether a patient is eligible for a clinical trial.
+
+{patient_text}
+
+Clinical Trial: {title}
+NCT ID: {nct_id}
+
+Eligibility Criteria:
+{criteria}
+
+Your task:
+1. Carefully parse the inclusion and exclusion criteria
+2. Compare each criterion against the patient's data
+3. Determine if the patient meets ALL inclusion criteria
+4. Determine if the patient violates ANY exclusion criteria
+5. Calculate an overall match score (0.0 to 1.0)
+6. Provide a clear explanation
+
+Respond in JSON format with this exact structure (no additional text):
+{{
+  "is_eligible": true,
+  "match_score": 0.85,
+  "inclusion_matches": ["criterion 1 met", "criterion 2 met"],
+  "inclusion_mismatches": ["criterion X not met"],
+  "exclusion_violations": ["exclusion Y violated"],
+  "exclusion_passes": ["exclusion A passed", "exclusion B passed"],
+  "explanation": "Brief summary for patient",
+  "reasoning": "Detailed reasoning"
+}}
+
+""" + _SCORING_GUIDANCE
+
+_BATCH_TRIAL_TEMPLATE = """### Trial {index}
+Clinical Trial: {title}
+NCT ID: {nct_id}
+
+Eligibility Criteria:
+{criteria}
+"""
+
+_BATCH_PROMPT_TEMPLATE = """You are a clinical trial matching expert. Analyze whether a patient is eligible for each of the {count} clinical trials below.
+
+{patient_text}
+
+{trials_text}
+Your task, for EACH trial independently:
+1. Carefully parse the inclusion and exclusion criteria
+2. Compare each criterion against the patient's data
+3. Determine if the patient meets ALL inclusion criteria
+4. Determine if the patient violates ANY exclusion criteria
+5. Calculate an overall match score (0.0 to 1.0)
+6. Provide a clear explanation
+
+Respond in JSON format with this exact structure (no additional text), with one entry per trial in the same order as above:
+{{
+  "results": [
+    {{
+      "nct_id": "NCT ID of the trial",
+      "is_eligible": true,
+      "match_score": 0.85,
+      "inclusion_matches": ["criterion 1 met", "criterion 2 met"],
+      "inclusion_mismatches": ["criterion X not met"],
+      "exclusion_violations": ["exclusion Y violated"],
+      "exclusion_passes": ["exclusion A passed", "exclusion B passed"],
+      "explanation": "Brief summary for patient",
+      "reasoning": "Detailed reasoning"
+    }}
+  ]
+}}
+
+""" + _SCORING_GUIDANCE
+
+
+# Criteria preprocessing: collapse whitespace (keeping line breaks), drop a
+# criteria-free preamble before an "Inclusion Criteria" heading and any
+# trailing "Study Design" section, then cap the length. Headings are matched
+# only at the start of a line, so "inclusion" in running text is left alone.
+_WS_RE = re.compile(r"[ \t]+")
+_NEWLINES_RE = re.compile(r"\s*\n\s*")
+_INCLUSION_HEADING_RE = re.compile(r"^(?:Key\s+)?Inclusion Criteria", re.I | re.M)
+_STUDY_DESIGN_HEADING_RE = re.compile(r"^Study Design", re.I | re.M)
+# Bullets, numbered items and "LABEL:" lines (e.g. NCI-style
+# "DISEASE CHARACTERISTICS:") mean the preamble holds criteria itself
+_CRITERIA_LINE_RE = re.compile(r"^(?:[*\-\u2022]|\d+[.)]|[A-Z][A-Z /&-]+:)", re.M)
+_TRUNCATED_MARKER = "\n[criteria truncated]"
+
+
+@functools.lru_cache(maxsize=1024)
+def _prep_criteria(text: str) -> str:
+    """Shrink eligibility criteria to the part the LLM needs, capped at MAX_CRITERIA_CHARS"""
+    text = _NEWLINES_RE.sub("\n", _WS_RE.sub(" ", text)).strip()
+
+    heading = _INCLUSION_HEADING_RE.search(text)
+    if heading and not _CRITERIA_LINE_RE.search(text, 0, heading.start()):
+        text = text[heading.start():]
+
+    design = _STUDY_DESIGN_HEADING_RE.search(text)
+    if design:
+        text = text[:design.start()].rstrip()
+
+    # Flag the cut so the model doesn't treat the criteria it sees as the
+    # complete list; exclusions usually come last and are lost first
+    if len(text) > settings.MAX_CRITERIA_CHARS:
+        text = text[:settings.MAX_CRITERIA_CHARS - len(_TRUNCATED_MARKER)].rstrip() + _TRUNCATED_MARKER
+    return text
+
+
+def _llm_output_schema() -> Dict[str, Any]:
+    """JSON schema of the fields the LLM fills in (MatchResult without the trial)"""
+    schema = MatchResult.model_json_schema()
+    schema.pop("$defs", None)
+    schema.pop("example", None)
+    schema["properties"].pop("trial")
+    schema["required"] = list(schema["properties"])
+    return schema
+
+
+# Structured-output schemas for the single-trial and batched prompts
+_MATCH_SCHEMA = _llm_output_schema()
+_BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                **_MATCH_SCHEMA,
+                "properties": {"nct_id": {"type": "string"}, **_MATCH_SCHEMA["properties"]},
+                "required": ["nct_id", *_MATCH_SCHEMA["required"]]
+            }
+        }
+    },
+    "required": ["results"]
+}
+
+
+class _InvalidLLMOutput(ValueError):
+    """The LLM's output parsed as JSON but a verdict field is unusable"""
+
+
+def _as_bool(value: Any) -> bool:
+    """Read an LLM boolean, accepting only true/false or their exact strings"""
+    if isinstance(value, bool):
+        return value
+    if value in ("true", "false"):
+        return value == "true"
+    raise _InvalidLLMOutput(f"is_eligible is not a boolean: {value!r}")
+
+
+def _as_score(value: Any) -> float:
+    """Read an LLM match score, which must be a finite number in 0-1"""
+    try:
+        if isinstance(value, bool):
+            raise TypeError
+        score = float(value)
+    except (TypeError, ValueError):
+        raise _InvalidLLMOutput(f"match_score is not a number: {value!r}")
+    if not (math.isfinite(score) and 0.0 <= score <= 1.0):
+        raise _InvalidLLMOutput(f"match_score is outside 0-1: {value!r}")
+    return score
+
+
+def _str_list(value: Any) -> List[str]:
+    """Coerce an LLM output field to a list of strings, dropping anything else"""
+    if not isinstance(value, list):
+        return []
+    return [str(item) for item in value]
+
+
+def _is_retryable(e: BaseException) -> bool:
+    """Whether an Ollama call failed transiently (timeout, 429 or 5xx)"""
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code == 429 or e.response.status_code >= 500
+    return isinstance(e, (httpx.TimeoutException, asyncio.TimeoutError))
+
 
 class TrialMatcher:
     """Matches patients to clinical trials using AI (Ollama or Anthropic)"""
@@ -23,132 +253,293 @@ class TrialMatcher:
         if self.provider == "ollama":
             self.ollama_url = settings.OLLAMA_BASE_URL
             self.model = settings.OLLAMA_MODEL
+            # Shared client so connections are pooled across requests; HTTP/2
+            # is negotiated when OLLAMA_BASE_URL is served over TLS
+            # The per-attempt total is bounded in _call_ollama (scaled by the
+            # number of trials in the prompt), so only connect is capped here
+            self._http = httpx.AsyncClient(
+                base_url=self.ollama_url,
+                http2=True,
+                timeout=httpx.Timeout(None, connect=5.0),
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+            )
+            # Errors that yield a fallback result once retries are exhausted;
+            # 429/5xx status errors are handled alongside via _is_retryable
+            self._transient_errors = (httpx.TimeoutException, asyncio.TimeoutError)
             logger.info(f"Using Ollama with model: {self.model}")
         elif self.provider == "anthropic":
             if not settings.ANTHROPIC_API_KEY:
                 raise ValueError("ANTHROPIC_API_KEY not configured for Anthropic provider")
-            from anthropic import Anthropic
-            self.client = Anthropic(api_key=settings.ANTHROPIC_API_KEY)
+            import anthropic
+            # The SDK retries 429/5xx/timeouts itself with exponential backoff
+            self.client = anthropic.AsyncAnthropic(
+                api_key=settings.ANTHROPIC_API_KEY,
+                timeout=settings.LLM_TIMEOUT,
+                max_retries=settings.LLM_MAX_ATTEMPTS - 1
+            )
+            self._transient_errors = (
+                anthropic.APITimeoutError,
+                anthropic.RateLimitError,
+                anthropic.InternalServerError,
+                anthropic.OverloadedError,  # HTTP 529, not an InternalServerError
+                asyncio.TimeoutError
+            )
             self.model = "claude-sonnet-4-5-20250929"
             logger.info(f"Using Anthropic Claude: {self.model}")
         else:
             raise ValueError(f"Unknown LLM provider: {self.provider}")
 
+        # Bounds concurrent LLM requests during fan-out
+        self._sem = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+
+        # Match results keyed by (patient, trial) fingerprint
+        self._cache: Optional[TTLCache] = None
+        if settings.ENABLE_CACHE:
+            self._cache = TTLCache(maxsize=10_000, ttl=settings.CACHE_EXPIRY_HOURS * 3600)
+
+    async def aclose(self):
+        """Close the provider's HTTP connections"""
+        if self.provider == "ollama":
+            await self._http.aclose()
+        else:
+            await self.client.close()
+
+    def _cache_key(self, patient_json: str, trial: ClinicalTrial) -> str:
+        """Fingerprint a (patient, trial) pair, including the trial's criteria text"""
+        criteria_digest = hashlib.blake2b(trial.eligibility_criteria.encode(), digest_size=16).digest()
+        return hashlib.blake2b(
+            patient_json.encode() + trial.nct_id.encode() + criteria_digest,
+            digest_size=16
+        ).hexdigest()
+
     def _format_patient_data(self, patient: PatientData) -> str:
         """Format patient data as readable text"""
-        text = f"Patient Profile:\n"
-        text += f"- Age: {patient.age} years\n"
-        text += f"- Gender: {patient.gender}\n"
+        parts: List[str] = [
+            f"Patient Profile:\n- Age: {patient.age} years\n- Gender: {patient.gender}\n"
+        ]
 
         if patient.conditions:
-            text += f"\nMedical Conditions:\n"
+            parts.append("\nMedical Conditions:\n")
             for condition in patient.conditions:
-                text += f"  - {condition.name}"
+                parts.append(f"  - {condition.name}")
                 if condition.icd10_code:
-                    text += f" (ICD-10: {condition.icd10_code})"
+                    parts.append(f" (ICD-10: {condition.icd10_code})")
                 if condition.onset_date:
-                    text += f" since {condition.onset_date}"
-                text += "\n"
+                    parts.append(f" since {condition.onset_date}")
+                parts.append("\n")
 
         if patient.medications:
-            text += f"\nCurrent Medications:\n"
+            parts.append("\nCurrent Medications:\n")
             for med in patient.medications:
-                text += f"  - {med.name}"
+                parts.append(f"  - {med.name}")
                 if med.dosage:
-                    text += f" {med.dosage}"
+                    parts.append(f" {med.dosage}")
                 if med.frequency:
-                    text += f", {med.frequency}"
-                text += "\n"
+                    parts.append(f", {med.frequency}")
+                parts.append("\n")
 
         if patient.lab_results:
-            text += f"\nRecent Lab Results:\n"
+            parts.append("\nRecent Lab Results:\n")
             for lab in patient.lab_results:
-                text += f"  - {lab.test_name}: {lab.value} {lab.unit}"
-                if lab.date:
-                    text += f" ({lab.date})"
-                text += "\n"
+                parts.append(f"  - {lab.test_name}: {lab.value} {lab.unit}")
+                if lab.test_date:
+                    parts.append(f" ({lab.test_date})")
+                parts.append("\n")
 
         if patient.smoking_status:
-            text += f"\nSmoking Status: {patient.smoking_status}\n"
+            parts.append(f"\nSmoking Status: {patient.smoking_status}\n")
 
         if patient.pregnancy_status is not None:
-            text += f"Pregnancy Status: {'Pregnant' if patient.pregnancy_status else 'Not pregnant'}\n"
+            parts.append(f"Pregnancy Status: {'Pregnant' if patient.pregnancy_status else 'Not pregnant'}\n")
 
-        return text
+        return "".join(parts)
 
     def _create_prompt(self, patient_text: str, trial: ClinicalTrial) -> str:
         """Create the matching prompt for any LLM"""
-        return f"""You are a clinical trial matching expert. Analyze whether a patient is eligible for a clinical trial.
-
-{patient_text}
-
-Clinical Trial: {trial.title}
-NCT ID: {trial.nct_id}
-
-Eligibility Criteria:
-{trial.eligibility_criteria}
-
-Your task:
-1. Carefully parse the inclusion and exclusion criteria
-2. Compare each criterion against the patient's data
-3. Determine if the patient meets ALL inclusion criteria
-4. Determine if the patient violates ANY exclusion criteria
-5. Calculate an overall match score (0.0 to 1.0)
-6. Provide a clear explanation
-
-Respond in JSON format with this exact structure (no additional text):
-{{
-  "is_eligible": true,
-  "match_score": 0.85,
-  "inclusion_matches": ["criterion 1 met", "criterion 2 met"],
-  "inclusion_mismatches": ["criterion X not met"],
-  "exclusion_violations": ["exclusion Y violated"],
-  "exclusion_passes": ["exclusion A passed", "exclusion B passed"],
-  "explanation": "Brief summary for patient",
-  "reasoning": "Detailed reasoning"
-}}
-
-Scoring guidance:
-- 1.0 = Perfect match, all inclusion met, no exclusions violated
-- 0.8-0.9 = Strong match, minor uncertainties
-- 0.6-0.7 = Moderate match, some criteria unclear
-- 0.4-0.5 = Weak match, significant mismatches
-- 0.0-0.3 = Poor match or exclusion violated
+        return _PROMPT_TEMPLATE.format(
+            patient_text=patient_text,
+            title=trial.title,
+            nct_id=trial.nct_id,
+            criteria=_prep_criteria(trial.eligibility_criteria)
+        )
 
-If eligibility criteria are missing or unclear, make reasonable assumptions based on the trial title and condition.
-IMPORTANT: Return ONLY the JSON object, no other text."""
+    def _create_batch_prompt(self, patient_text: str, trials: List[ClinicalTrial]) -> str:
+        """Create a single prompt that matches the patient against several trials"""
+        trials_text = "\n".join(
+            _BATCH_TRIAL_TEMPLATE.format(
+                index=i,
+                title=trial.title,
+                nct_id=trial.nct_id,
+                criteria=_prep_criteria(trial.eligibility_criteria)
+            )
+            for i, trial in enumerate(trials, start=1)
+        )
+        return _BATCH_PROMPT_TEMPLATE.format(
+            count=len(trials),
+            patient_text=patient_text,
+            trials_text=trials_text
+        )
 
-    async def _call_ollama(self, prompt: str) -> str:
-        """Call Ollama local API"""
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(
-                f"{self.ollama_url}/api/generate",
+    @retry(
+        retry=retry_if_exception(_is_retryable),
+        wait=wait_exponential_jitter(initial=1, max=10),
+        stop=stop_after_attempt(settings.LLM_MAX_ATTEMPTS),
+        reraise=True
+    )
+    async def _call_ollama(
+        self,
+        prompt: str,
+        schema: Dict[str, Any],
+        max_tokens: int = 2000,
+        timeout: float = settings.LLM_TIMEOUT
+    ) -> str:
+        """Call Ollama local API, retrying transient failures"""
+        # Taken per attempt so a request waiting out its backoff doesn't hold
+        # a concurrency slot
+        async with self._sem:
+            response = await asyncio.wait_for(self._http.post(
+                "/api/generate",
                 json={
                     "model": self.model,
                     "prompt": prompt,
                     "stream": False,
-                    "format": "json",  # Request JSON format
+                    "format": schema,  # Constrain output to the JSON schema
                     "options": {
                         "temperature": 0.0,  # Deterministic
-                        "num_predict": 2000
+                        "num_predict": max_tokens
                     }
                 }
+            ), timeout=timeout)
+        response.raise_for_status()
+        data = response.json()
+        return data.get("response", "")
+
+    async def _call_anthropic(
+        self,
+        prompt: str,
+        schema: Dict[str, Any],
+        max_tokens: int = 2000,
+        timeout: float = settings.LLM_TIMEOUT
+    ) -> Dict[str, Any]:
+        """Call Anthropic Claude API, forcing a tool call whose input follows the schema"""
+        async with self._sem:
+            response = await self.client.messages.create(
+                model=self.model,
+                max_tokens=max_tokens,
+                temperature=0.0,
+                tools=[{
+                    "name": "emit_match",
+                    "description": "Record the eligibility assessment",
+                    "input_schema": schema
+                }],
+                tool_choice={"type": "tool", "name": "emit_match"},
+                messages=[
+                    {"role": "user", "content": prompt}
+                ],
+                timeout=timeout  # Per attempt; the SDK applies it to each of its retries
             )
-            response.raise_for_status()
-            data = response.json()
-            return data.get("response", "")
-
-    async def _call_anthropic(self, prompt: str) -> str:
-        """Call Anthropic Claude API"""
-        response = self.client.messages.create(
-            model=self.model,
-            max_tokens=2000,
-            temperature=0.0,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
+        for block in response.content:
+            if block.type == "tool_use":
+                return block.input
+
+        # Treated like unparseable output (e.g. the response hit max_tokens)
+        raise orjson.JSONDecodeError(f"No emit_match tool call (stop_reason={response.stop_reason})", "", 0)
+
+    async def _call_llm(
+        self,
+        prompt: str,
+        schema: Dict[str, Any],
+        max_tokens: int = 2000,
+        trial_count: int = 1
+    ) -> Any:
+        """Call the configured LLM provider and return its parsed JSON output"""
+        # Generation time grows with the number of trials in the prompt
+        timeout = settings.LLM_TIMEOUT * trial_count
+        if self.provider == "anthropic":
+            return await self._call_anthropic(prompt, schema, max_tokens, timeout)
+
+        response_text = await self._call_ollama(prompt, schema, max_tokens, timeout)
+        try:
+            return self._parse_json_response(response_text)
+        except orjson.JSONDecodeError:
+            logger.error(f"Response text: {response_text[:500]}")
+            raise
+
+    def _parse_json_response(self, response_text: str) -> Any:
+        """Parse the JSON payload from an LLM response"""
+        # Schema-constrained output is plain JSON
+        try:
+            return orjson.loads(response_text)
+        except orjson.JSONDecodeError:
+            pass
+
+        # Servers that ignore the schema may wrap the JSON in prose or fences
+        buf = response_text.encode()
+        match = _JSON_RE.search(buf)
+        if match is None:
+            return orjson.loads(buf)
+
+        try:
+            return orjson.loads(match.group(0))
+        except orjson.JSONDecodeError:
+            # Trailing text after the object may itself contain braces
+            span = _balanced_object(buf)
+            if span is None:
+                raise
+            return orjson.loads(span)
+
+    def _build_match_result(self, trial: ClinicalTrial, result_data: Dict[str, Any]) -> MatchResult:
+        """Create a MatchResult from the LLM's parsed JSON output, raising _InvalidLLMOutput if the verdict is unusable"""
+        # model_construct skips validation, and the LLM output isn't
+        # guaranteed to follow the schema (Anthropic tool input isn't strictly
+        # checked; older Ollama servers ignore "format"). A malformed score or
+        # eligibility flag rejects the output; the descriptive fields are
+        # coerced.
+        if not isinstance(result_data, dict):
+            raise _InvalidLLMOutput(f"expected a JSON object, got {type(result_data).__name__}")
+        match_score = _as_score(result_data.get("match_score"))
+        is_eligible = _as_bool(result_data.get("is_eligible"))
+        explanation = result_data.get("explanation")
+        reasoning = result_data.get("reasoning")
+        return MatchResult.model_construct(
+            trial=trial,
+            match_score=match_score,
+            is_eligible=is_eligible,
+            inclusion_matches=_str_list(result_data.get("inclusion_matches")),
+            inclusion_mismatches=_str_list(result_data.get("inclusion_mismatches")),
+            exclusion_violations=_str_list(result_data.get("exclusion_violations")),
+            exclusion_passes=_str_list(result_data.get("exclusion_passes")),
+            explanation=str(explanation) if explanation is not None else "Unable to determine eligibility",
+            reasoning=str(reasoning) if reasoning is not None else ""
+        )
+
+    def _fallback_result(self, trial: ClinicalTrial, reasoning: str) -> MatchResult:
+        """Fallback result used when the LLM output cannot be processed"""
+        return MatchResult.model_construct(
+            trial=trial,
+            match_score=0.0,
+            is_eligible=False,
+            inclusion_matches=[],
+            inclusion_mismatches=[],
+            exclusion_violations=[],
+            exclusion_passes=[],
+            explanation="Error processing eligibility criteria",
+            reasoning=reasoning
         )
-        return response.content[0].text
+
+    def _raise_http_error(self, e: httpx.HTTPError):
+        """Log an HTTP error from the LLM provider and re-raise it"""
+        logger.error(f"HTTP error calling {self.provider}: {e}")
+        if self.provider == "ollama":
+            raise Exception(
+                f"Cannot connect to Ollama. Make sure Ollama is running on {self.ollama_url}. "
+                f"Install from https://ollama.ai and run: ollama pull {self.model}"
+            )
+        raise e
+
+    def _patient_json(self, patient: PatientData) -> Optional[str]:
+        """Serialized patient used for cache keys, or None when caching is off"""
+        return patient.model_dump_json() if self._cache is not None else None
 
     async def match_patient_to_trial(
         self,
@@ -165,112 +556,247 @@ IMPORTANT: Return ONLY the JSON object, no other text."""
         Returns:
             MatchResult with detailed matching information
         """
-        patient_text = self._format_patient_data(patient)
+        return await self._match_with_text(
+            self._format_patient_data(patient),
+            self._patient_json(patient),
+            trial
+        )
+
+    async def _match_with_text(
+        self,
+        patient_text: str,
+        patient_json: Optional[str],
+        trial: ClinicalTrial
+    ) -> MatchResult:
+        """
+        Match pre-formatted patient text to a single trial
+
+        Args:
+            patient_text: Output of _format_patient_data
+            patient_json: Output of _patient_json, used for the result cache
+            trial: Clinical trial
+
+        Returns:
+            MatchResult with detailed matching information
+        """
+        cache_key = None
+        if patient_json is not None:
+            cache_key = self._cache_key(patient_json, trial)
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"Cache hit for {trial.nct_id}")
+                return cached
+
         prompt = self._create_prompt(patient_text, trial)
 
         try:
-            # Call appropriate LLM provider
-            if self.provider == "ollama":
-                response_text = await self._call_ollama(prompt)
-            else:  # anthropic
-                response_text = await self._call_anthropic(prompt)
-
-            # Parse JSON from response
-            # LLMs might wrap JSON in markdown code blocks
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0].strip()
-
-            # Clean up any leading/trailing text
-            response_text = response_text.strip()
-            if not response_text.startswith('{'):
-                # Try to find the first { and last }
-                start = response_text.find('{')
-                end = response_text.rfind('}')
-                if start != -1 and end != -1:
-                    response_text = response_text[start:end+1]
-
-            result_data = json.loads(response_text)
-
-            # Create MatchResult
-            match_result = MatchResult(
-                trial=trial,
-                match_score=float(result_data.get("match_score", 0.0)),
-                is_eligible=bool(result_data.get("is_eligible", False)),
-                inclusion_matches=result_data.get("inclusion_matches", []),
-                inclusion_mismatches=result_data.get("inclusion_mismatches", []),
-                exclusion_violations=result_data.get("exclusion_violations", []),
-                exclusion_passes=result_data.get("exclusion_passes", []),
-                explanation=result_data.get("explanation", "Unable to determine eligibility"),
-                reasoning=result_data.get("reasoning", "")
-            )
+            result_data = await self._call_llm(prompt, _MATCH_SCHEMA)
+            match_result = self._build_match_result(trial, result_data)
+
+            if cache_key is not None:
+                self._cache[cache_key] = match_result
 
             logger.info(f"Matched {trial.nct_id} using {self.provider}: score={match_result.match_score:.2f}, eligible={match_result.is_eligible}")
             return match_result
 
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logger.error(f"Error parsing {self.provider} response as JSON: {e}")
-            logger.error(f"Response text: {response_text[:500]}")
+            return self._fallback_result(trial, f"LLM response parsing error: {str(e)}")
 
-            # Fallback result
-            return MatchResult(
-                trial=trial,
-                match_score=0.0,
-                is_eligible=False,
-                inclusion_matches=[],
-                inclusion_mismatches=[],
-                exclusion_violations=[],
-                exclusion_passes=[],
-                explanation="Error processing eligibility criteria",
-                reasoning=f"LLM response parsing error: {str(e)}"
-            )
+        except _InvalidLLMOutput as e:
+            logger.error(f"Invalid {self.provider} result for {trial.nct_id}: {e}")
+            return self._fallback_result(trial, f"LLM response parsing error: {str(e)}")
 
-        except httpx.HTTPError as e:
-            logger.error(f"HTTP error calling {self.provider}: {e}")
-            if self.provider == "ollama":
-                raise Exception(
-                    f"Cannot connect to Ollama. Make sure Ollama is running on {self.ollama_url}. "
-                    "Install from https://ollama.ai and run: ollama pull {self.model}"
-                )
+        except asyncio.CancelledError:
             raise
 
+        except self._transient_errors as e:
+            logger.error(f"{self.provider} request for {trial.nct_id} failed: {e!r}")
+            return self._fallback_result(trial, f"LLM request failed: {e!r}")
+
+        except httpx.HTTPStatusError as e:
+            # Only 429/5xx are transient; e.g. a 404 for a missing model is a setup error
+            if not _is_retryable(e):
+                self._raise_http_error(e)
+            logger.error(f"{self.provider} request for {trial.nct_id} failed: {e!r}")
+            return self._fallback_result(trial, f"LLM request failed: {e!r}")
+
+        except httpx.HTTPError as e:
+            self._raise_http_error(e)
+
         except Exception as e:
             logger.error(f"Error matching patient to trial with {self.provider}: {e}")
             raise
 
+    async def _match_batch(
+        self,
+        patient_text: str,
+        patient_json: Optional[str],
+        trials_chunk: List[ClinicalTrial]
+    ) -> List[MatchResult]:
+        """
+        Match pre-formatted patient text to several trials with a single LLM call
+
+        Args:
+            patient_text: Output of _format_patient_data
+            patient_json: Output of _patient_json, used for the result cache
+            trials_chunk: Trials to evaluate in one prompt
+
+        Returns:
+            One MatchResult per trial, in the same order as trials_chunk
+        """
+        prompt = self._create_batch_prompt(patient_text, trials_chunk)
+
+        try:
+            result_data = await self._call_llm(
+                prompt,
+                _BATCH_SCHEMA,
+                max_tokens=2000 * len(trials_chunk),
+                trial_count=len(trials_chunk)
+            )
+            entries = result_data.get("results", []) if isinstance(result_data, dict) else []
+
+        except orjson.JSONDecodeError as e:
+            logger.error(f"Error parsing {self.provider} batch response as JSON: {e}")
+            return [
+                self._fallback_result(trial, f"LLM response parsing error: {str(e)}")
+                for trial in trials_chunk
+            ]
+
+        except asyncio.CancelledError:
+            raise
+
+        except self._transient_errors as e:
+            logger.error(f"{self.provider} batch request failed: {e!r}")
+            return [
+                self._fallback_result(trial, f"LLM request failed: {e!r}")
+                for trial in trials_chunk
+            ]
+
+        except httpx.HTTPStatusError as e:
+            # Only 429/5xx are transient; e.g. a 404 for a missing model is a setup error
+            if not _is_retryable(e):
+                self._raise_http_error(e)
+            logger.error(f"{self.provider} batch request failed: {e!r}")
+            return [
+                self._fallback_result(trial, f"LLM request failed: {e!r}")
+                for trial in trials_chunk
+            ]
+
+        except httpx.HTTPError as e:
+            self._raise_http_error(e)
+
+        # Prefer matching entries by NCT ID, falling back to position only for
+        # entries not labelled with another trial in this chunk, so one
+        # trial's verdict is never reported under another
+        by_nct = {entry.get("nct_id"): entry for entry in entries if isinstance(entry, dict)}
+        chunk_ids = {trial.nct_id for trial in trials_chunk}
+        results = []
+        for i, trial in enumerate(trials_chunk):
+            entry = by_nct.get(trial.nct_id)
+            if entry is None and i < len(entries) and isinstance(entries[i], dict):
+                if entries[i].get("nct_id") not in chunk_ids:
+                    entry = entries[i]
+
+            if entry is None:
+                logger.error(f"No result for {trial.nct_id} in {self.provider} batch response")
+                results.append(self._fallback_result(trial, "LLM batch response missing this trial"))
+                continue
+
+            try:
+                match_result = self._build_match_result(trial, entry)
+            except _InvalidLLMOutput as e:
+                logger.error(f"Invalid {self.provider} result for {trial.nct_id}: {e}")
+                results.append(self._fallback_result(trial, f"LLM response parsing error: {str(e)}"))
+                continue
+
+            if patient_json is not None:
+                self._cache[self._cache_key(patient_json, trial)] = match_result
+
+            logger.info(f"Matched {trial.nct_id} using {self.provider}: score={match_result.match_score:.2f}, eligible={match_result.is_eligible}")
+            results.append(match_result)
+
+        return results
+
     async def match_patient_to_trials(
         self,
         patient: PatientData,
         trials: List[ClinicalTrial],
-        min_score: float = 0.0
+        min_score: float = 0.0,
+        top_k: Optional[int] = None
     ) -> List[MatchResult]:
         """
         Match a patient to multiple trials
 
+        Trials are sent to the LLM in groups of settings.LLM_BATCH_SIZE, and
+        the groups are evaluated concurrently.
+
         Args:
             patient: Patient data
             trials: List of clinical trials
             min_score: Minimum match score to include (0.0 to 1.0)
+            top_k: Only return the top_k highest-scoring results (all if None)
 
         Returns:
             List of MatchResults, sorted by match score (highest first)
         """
-        results = []
-
-        for trial in trials:
-            try:
-                match_result = await self.match_patient_to_trial(patient, trial)
+        # Format the patient once for the whole batch
+        patient_text = self._format_patient_data(patient)
+        patient_json = self._patient_json(patient)
+
+        # Each NCT ID is matched once, even if the search returned it twice
+        unique = list({trial.nct_id: trial for trial in trials}.values())
+        results_by_nct: Dict[str, MatchResult] = {}
+        pending = unique
+
+        # Serve previously matched (patient, trial) pairs from the cache
+        if patient_json is not None:
+            pending = []
+            for trial in unique:
+                cached = self._cache.get(self._cache_key(patient_json, trial))
+                if cached is None:
+                    pending.append(trial)
+                else:
+                    results_by_nct[trial.nct_id] = cached
+
+        batch_size = max(1, settings.LLM_BATCH_SIZE)
+        chunks = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+
+        async def _one(chunk: List[ClinicalTrial]) -> List[MatchResult]:
+            if len(chunk) == 1:
+                return [await self._match_with_text(patient_text, patient_json, chunk[0])]
+            return await self._match_batch(patient_text, patient_json, chunk)
+
+        # Match all chunks concurrently; the LLM calls themselves are bounded
+        # by the semaphore
+        raw = await asyncio.gather(*[_one(chunk) for chunk in chunks], return_exceptions=True)
+
+        # gather() hands cancellations back as results; propagate them
+        for chunk_results in raw:
+            if isinstance(chunk_results, asyncio.CancelledError):
+                raise chunk_results
+
+        for chunk, chunk_results in zip(chunks, raw):
+            if isinstance(chunk_results, Exception):
+                nct_ids = ", ".join(trial.nct_id for trial in chunk)
+                logger.error(f"Error matching trials {nct_ids}: {chunk_results}")
+                continue
 
-                if match_result.match_score >= min_score:
-                    results.append(match_result)
+            for match_result in chunk_results:
+                results_by_nct[match_result.trial.nct_id] = match_result
 
-            except Exception as e:
-                logger.error(f"Error matching trial {trial.nct_id}: {e}")
-                continue
+        # Fan results back out to every input trial, duplicates included
+        results = [
+            results_by_nct[trial.nct_id]
+            for trial in trials
+            if trial.nct_id in results_by_nct and results_by_nct[trial.nct_id].match_score >= min_score
+        ]
 
         # Sort by match score descending
-        results.sort(key=lambda x: x.match_score, reverse=True)
+        if top_k is None:
+            results.sort(key=lambda x: x.match_score, reverse=True)
+        else:
+            results = heapq.nlargest(top_k, results, key=lambda x: x.match_score)
 
         logger.info(f"Matched patient to {len(results)} trials using {self.provider} (min_score={min_score})")
         return results